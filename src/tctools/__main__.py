@@ -1,10 +1,82 @@
-import argparse
+"""Entrypoint for ``python -m tctools <tool> ...``.
 
+Only the module of the requested tool is imported, so e.g. ``--help`` does not need to
+load any of the (heavier) tool dependencies.
+"""
+from __future__ import annotations
+
+import importlib
+import sys
+from typing import Optional, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import argparse
+
+
+DESCRIPTION = "Run one of the TwinCAT tools, e.g. ``tctools format --help``"
+
+# Tool name -> (`<module>:<function>`, short help)
+TOOLS = {
+    "format": ("tctools.format:main", "Format the PLC code inside TwinCAT files"),
+    "xml_sort": ("tctools.xml_sort:main", "Alphabetically sort the nodes in XML files"),
+    "git_info": ("tctools.git_info:main", "Create a file with version info from Git"),
+    "make_release": ("tctools.make_release:main", "Create a release archive"),
+}
+
+
+def _sniff_subcommand(argv: Sequence[str]) -> Optional[str]:
+    """Return the tool name if it is the first argument, without parsing anything."""
+    if argv and argv[0] in TOOLS:
+        return argv[0]
+
+    return None
+
+
+def get_help() -> str:
+    """Get the help text, without going through ``argparse``."""
+    lines = [
+        "usage: tctools [-h] tool ...",
+        "",
+        DESCRIPTION,
+        "",
+        "tools:",
+    ]
+    width = max(len(name) for name in TOOLS)
+    lines += [f"  {name:<{width}}  {help_str}" for name, (_, help_str) in TOOLS.items()]
+    return "\n".join(lines)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Get a parser that only lists the tools (their own arguments are not added)."""
+    import argparse
 
-if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         prog="tctools",
-        description="Use either `tctools.format` or `tctools.xml_sorter`",
+        description=DESCRIPTION,
     )
+    subparsers = parser.add_subparsers(title="tools", metavar="tool")
+    for name, (_, help_str) in TOOLS.items():
+        subparsers.add_parser(name, help=help_str, add_help=False)
+
+    return parser
+
 
-    parser.print_help()
+def main(*args) -> int:
+    if not args or args[0] in ("-h", "--help"):
+        print(get_help())  # Most common call, skip importing `argparse` entirely
+        return 0
+
+    tool = _sniff_subcommand(args)
+    if tool is None:
+        parser = get_parser()
+        parser.parse_args(args)  # Exits for unrecognized arguments
+        parser.print_help()
+        return 0
+
+    module_name, _, func_name = TOOLS[tool][0].partition(":")
+    func = getattr(importlib.import_module(module_name), func_name)
+    return func(*args[1:])
+
+
+if __name__ == "__main__":
+    exit(main(*sys.argv[1:]))  # Skip script name
@@ -1,21 +1,81 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
-from typing import Optional, List
+from typing import Optional, List, Dict, Iterator, Callable, Any, TYPE_CHECKING
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from lxml import etree
+import fnmatch
+import hashlib
+import json
 import logging
+import os
+import re
 import sys
+import threading
+
+if TYPE_CHECKING:
+    # `lxml` is only imported when a tool really needs it, to keep CLI startup fast
+    from lxml import etree
+
+    # Create type hinting shortcuts:
+    Element = etree._Element  # noqa
+    ElementTree = etree._ElementTree  # noqa
+
+
+_LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+_LOG_LEVEL_NAMES = tuple(_LOG_LEVELS)
+
+_DEFAULT_FILTER = ("*.tsproj", "*.xti", "*.plcproj")
+
+# Arguments that don't change the result for a file, ignored for `--cache`:
+_CACHE_IGNORED_ARGS = {
+    "target",
+    "check",
+    "dry",
+    "log_level",
+    "recursive",
+    "filter",
+    "cache",
+    "jobs",
+}
+
+
+@lru_cache(maxsize=None)
+def _configure_logging():
+    """Configure logging once, for the first tool instance.
+
+    This is not done on import, so users can still call ``logging.basicConfig()``
+    themselves after importing (which is a no-op once a handler exists).
+    """
+    logging.basicConfig(stream=sys.stdout)
 
 
-# Create type hinting shortcuts:
-Element = etree._Element  # noqa
-ElementTree = etree._ElementTree  # noqa
+@lru_cache(maxsize=None)
+def _get_version() -> str:
+    """Get the installed version of this package (only imported when needed)."""
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        return version("twincat-tools")
+    except PackageNotFoundError:
+        return "unknown"  # E.g. running from source
 
 
 class Tool(ABC):
     """Tools base class.
 
     ``argparse`` is done in the constructor, CLI arguments should be passed there.
+
+    Use :meth:`dlog` for debug messages inside loops, with ``%s``-style arguments
+    instead of f-strings, so nothing is formatted when debug output is disabled.
     """
 
     LOGGER_NAME: Optional[str] = None
@@ -30,8 +90,18 @@ class Tool(ABC):
 
     @classmethod
     def get_argument_parser(cls) -> ArgumentParser:
-        parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
-        cls.set_arguments(parser)
+        """Get parser for this tool.
+
+        The parser is built only once per class, since parsing arguments does not
+        modify it.
+        """
+        # Look in `__dict__` directly, so a subclass doesn't get the parser of its base
+        parser = cls.__dict__.get("_parser", None)
+        if parser is None:
+            parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+            cls.set_arguments(parser)
+            cls._parser = parser
+
         return parser
 
     @classmethod
@@ -46,7 +116,7 @@ class Tool(ABC):
         parser.add_argument(
             "--log-level",
             "-l",
-            choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+            choices=_LOG_LEVEL_NAMES,
             help="Set log level to change verbosity",
             default="INFO",
         )
@@ -58,25 +128,36 @@ class Tool(ABC):
 
     def get_logger(self):
         """Get logger for this class."""
-        logging.basicConfig(stream=sys.stdout)
+        _configure_logging()
         logger = logging.getLogger(self.LOGGER_NAME or __name__)
-        if "log_level" in self.args and self.args.log_level:
-            level = logging.getLevelName(self.args.log_level)
-            logger.setLevel(level)
+        level_name = getattr(self.args, "log_level", None)
+        if level_name:
+            logger.setLevel(_LOG_LEVELS[level_name])
 
         return logger
 
+    def dlog(self, msg: str, *args):
+        """Log a debug message, skipping all work if debug messages are disabled."""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, *args)
+
 
 class TcTool(Tool, ABC):
     """Base class for tools sharing TwinCAT functionality."""
 
+    _re_xml_header = re.compile(rb"<\?xml\s[^?]*\?>")  # Only the declaration itself
+
     def __init__(self, *args):
         super().__init__(*args)
 
-        # Preserve `CDATA` XML flags:
-        self.xml_parser = etree.XMLParser(strip_cdata=False)
+        self._local = threading.local()  # State per thread, see `process_files()`
+        self._lock = threading.Lock()  # Guard the file counters between threads
+
+        self._re_filter: Optional[re.Pattern] = None  # See `get_filter_pattern()`
 
-        self.header_before: Optional[str] = None  # Header of the last XML path
+        # Files that need no changes, see `is_file_cached()`:
+        self._cache: Optional[Dict[str, List]] = None
+        self._cache_changed = False
 
         self.files_checked = 0  # Files read by parser
         self.files_to_alter = 0  # Files that seem to require changes
@@ -109,48 +190,294 @@ class TcTool(Tool, ABC):
             "--filter",
             help="Target files only with these patterns",
             nargs="+",
-            default=["*.tsproj", "*.xti", "*.plcproj"],
+            default=_DEFAULT_FILTER,
+        )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            help="Number of files to process in parallel, files are processed one by "
+            "one unless this is given",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--cache",
+            help="Remember files that need no changes and skip them in later runs, as "
+            "long as they are not modified",
+            action="store_true",
+            default=False,
         )
 
         return parser
 
-    @staticmethod
-    def get_xml_header(file: str) -> Optional[str]:
+    @property
+    def xml_parser(self) -> etree.XMLParser:
+        """XML parser of the current thread.
+
+        One parser is re-used for all files, but lxml parsers are not thread-safe.
+        """
+        parser = getattr(self._local, "xml_parser", None)
+        if parser is None:
+            from lxml import etree
+
+            parser = etree.XMLParser(
+                strip_cdata=False,  # Preserve `CDATA` XML flags
+                collect_ids=False,  # Skip building a hash table of IDs, never used
+                resolve_entities=False,  # TwinCAT files don't declare custom entities
+                no_network=True,  # Never fetch external resources
+            )
+            self._local.xml_parser = parser
+
+        return parser
+
+    @property
+    def header_before(self) -> Optional[str]:
+        """Header of the last XML path (read by the current thread)."""
+        return getattr(self._local, "header_before", None)
+
+    @header_before.setter
+    def header_before(self, value: Optional[str]):
+        self._local.header_before = value
+
+    @property
+    def content_before(self) -> Optional[bytes]:
+        """Raw content of the last XML path (read by the current thread)."""
+        return getattr(self._local, "content_before", None)
+
+    @content_before.setter
+    def content_before(self, value: Optional[bytes]):
+        self._local.content_before = value
+
+    @classmethod
+    def get_xml_header(cls, file: str) -> Optional[str]:
         """Get raw XML header as string."""
-        with open(file, "r") as fh:
+        with open(file, "rb") as fh:
             # Search only the start of the path, otherwise give up
-            for _ in range(100):
-                line = fh.readline()
-                if line.startswith("<?xml") and line.rstrip().endswith("?>"):
-                    return line.strip()
+            return cls._find_xml_header(fh.read(512))
 
-        return None
+    @classmethod
+    def _find_xml_header(cls, data: bytes) -> Optional[str]:
+        """Get raw XML header from the (first bytes of the) content of a file."""
+        match = cls._re_xml_header.search(data, 0, 512)
+        return match.group().decode("utf-8") if match else None
 
     def get_xml_tree(self, path: str) -> ElementTree:
-        """Get parsed XML path."""
-        tree = etree.parse(path, self.xml_parser)
+        """Get parsed XML path.
 
-        self.header_before = self.get_xml_header(path)
+        The file is read only once, the raw content is kept in :attr:`content_before`.
+        """
+        from lxml import etree
+
+        with open(path, "rb") as fh:
+            self.content_before = fh.read()
+
+        root = etree.fromstring(self.content_before, self.xml_parser, base_url=path)
+        tree = root.getroottree()
+
+        # lxml already knows if there is a declaration at all (`standalone` is `None`
+        # only without one), but the raw text is still needed to reproduce it exactly
+        if tree.docinfo.standalone is None:
+            self.header_before = None
+        else:
+            self.header_before = self._find_xml_header(self.content_before)
 
         return tree
 
+    def get_cache_path(self) -> Path:
+        """Get location of the file used for ``--cache``."""
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        return Path(cache_home) / "tctools" / f"{type(self).__name__}.json"
+
+    def get_cache_entry(self, path: str, extra: str = "") -> Optional[List]:
+        """Get cache value for a file, based on its status and the tool options.
+
+        Get this *before* reading the file and pass it on to :meth:`is_file_cached`
+        and :meth:`cache_file`, so a file saved in the meantime is not recorded as
+        clean. Returns ``None`` without ``--cache``.
+
+        :param path:
+        :param extra: Additional settings the result for this file depends on
+        """
+        if not self.args.cache:
+            return None
+
+        settings = {
+            key: value
+            for key, value in vars(self.args).items()
+            if key not in _CACHE_IGNORED_ARGS
+        }
+        settings["version"] = _get_version()  # Rules might change between releases
+        settings_str = json.dumps(settings, sort_keys=True) + extra
+        stat = os.stat(path)
+        return [
+            stat.st_mtime_ns,
+            stat.st_size,
+            hashlib.sha1(settings_str.encode()).hexdigest(),
+        ]
+
+    def _load_cache(self) -> Dict[str, List]:
+        """Get cache content, reading it from disk the first time."""
+        if self._cache is None:
+            try:
+                with open(self.get_cache_path(), "r") as fh:
+                    self._cache = json.load(fh)
+            except (OSError, ValueError):
+                self._cache = {}  # Missing or corrupt, start over
+
+        return self._cache
+
+    def is_file_cached(self, path: str, entry: Optional[List]) -> bool:
+        """Return True if a file is known to need no changes (only with ``--cache``).
+
+        :param path:
+        :param entry: Result of :meth:`get_cache_entry`
+        """
+        if entry is None:
+            return False
+
+        with self._lock:
+            return self._load_cache().get(path, None) == entry
+
+    def cache_file(self, path: str, entry: Optional[List]):
+        """Register a file as not needing any changes (only with ``--cache``).
+
+        See :meth:`is_file_cached`.
+        """
+        if entry is None:
+            return
+
+        with self._lock:
+            self._load_cache()[path] = entry
+            self._cache_changed = True
+
+    def save_cache(self):
+        """Write registered files to disk, see :meth:`cache_file`.
+
+        Entries of files that no longer exist are dropped at the same time.
+        """
+        if self._cache is not None:
+            cache = {
+                path: entry
+                for path, entry in self._cache.items()
+                if os.path.isfile(path)
+            }
+            if len(cache) != len(self._cache):
+                self._cache = cache
+                self._cache_changed = True
+
+        if not self._cache_changed:
+            return
+
+        cache_path = self.get_cache_path()
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_suffix(".tmp")
+        with open(temp_path, "w") as fh:
+            json.dump(self._cache, fh)
+        os.replace(temp_path, cache_path)  # Replace at once, never leave half a file
+        self._cache_changed = False
+
+    def process_files(
+        self, files: List[Path], func: Callable[[str], Any], jobs: Optional[int] = None
+    ):
+        """Call ``func`` for every file, spread over a pool of threads.
+
+        lxml releases the GIL while parsing and serializing, so files really are
+        processed in parallel.
+
+        :param files: Result of :meth:`find_files`
+        :param func: Callable that takes a single path
+        :param jobs: Maximum number of threads (default: number of CPUs)
+        """
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+
+        if jobs <= 1 or len(files) <= 1:
+            for file in files:
+                func(str(file))
+            return
+
+        with ThreadPoolExecutor(max_workers=min(jobs, len(files))) as executor:
+            for _ in executor.map(func, map(str, files)):
+                pass  # Consume results to raise any exceptions
+
+    def get_filter_pattern(self) -> Optional[re.Pattern]:
+        """Get a single regex matching any of the ``--filter`` globs on a file name.
+
+        Globs with a folder part are left out, see :meth:`get_path_filters`. The
+        pattern is compiled only once.
+        """
+        if self._re_filter is None and self.args.filter:
+            name_filters = [
+                filt for filt in self.args.filter if not self._is_path_filter(filt)
+            ]
+            if name_filters:
+                self._re_filter = re.compile(
+                    "|".join(
+                        fnmatch.translate(os.path.normcase(filt))
+                        for filt in name_filters
+                    )
+                )
+
+        return self._re_filter
+
+    def get_path_filters(self) -> List[str]:
+        """Get the ``--filter`` globs that have a folder part, like ``POUs/*.TcPOU``."""
+        return [filt for filt in self.args.filter or () if self._is_path_filter(filt)]
+
+    @staticmethod
+    def _is_path_filter(filt: str) -> bool:
+        return "/" in filt or os.sep in filt
+
     def find_files(self) -> List[Path]:
-        """Use argparse arguments to get a set of target files."""
-        files = []
+        """Use argparse arguments to get a set of target files.
+
+        Paths are handled as plain strings, ``Path`` objects are only created for the
+        result. Filters with a folder part cannot be matched on file names, these are
+        relative to the target (or any sub folder with ``-r``) and use ``glob()``.
+        """
+        files: List[str] = []
         if not self.args.target:
-            return files
+            return []
+
+        pattern = self.get_filter_pattern()
+        path_filters = self.get_path_filters()
 
         for target in self.args.target:
-            path = Path(target).resolve()
-            if path.is_file():
+            path = os.path.abspath(target)  # Skip `resolve()` syscalls
+            if os.path.isfile(path):
                 files.append(path)
-            elif path.is_dir():
-                if self.args.filter:
-                    for filt in self.args.filter:
-                        if self.args.recursive:
-                            filt = f"**/{filt}"
-                        files += path.glob(filt)
+            elif os.path.isdir(path):
+                if pattern:
+                    files.extend(self._scan_dir(path, pattern, self.args.recursive))
+                for filt in path_filters:
+                    if self.args.recursive:
+                        filt = f"**/{filt}"
+                    files.extend(str(p) for p in Path(path).glob(filt) if p.is_file())
             else:
                 raise ValueError(f"Could not find path or folder: `{target}`")
 
-        return files
+        return [Path(file) for file in dict.fromkeys(files)]  # Drop duplicates
+
+    @classmethod
+    def _scan_dir(
+        cls, directory: str, pattern: re.Pattern, recursive: bool
+    ) -> Iterator[str]:
+        """Yield files in a directory whose name matches the pattern.
+
+        Working with plain strings and ``os.scandir`` is a lot faster than ``glob()``
+        for every filter separately, because the tree is walked only once.
+        """
+        with os.scandir(directory) as entries:
+            subdirectories = []
+            for entry in entries:
+                if entry.is_file():
+                    name = os.path.normcase(entry.name)
+                    if pattern.match(name):
+                        yield entry.path
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+
+        for subdirectory in subdirectories:
+            yield from cls._scan_dir(subdirectory, pattern, recursive)
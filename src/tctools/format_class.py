@@ -1,7 +1,16 @@
 from editorconfig import get_properties
-from typing import List, Tuple, Type, Optional
-from collections import OrderedDict
+from editorconfig.ini import EditorConfigParser
+from typing import List, Dict, Tuple, Type, Optional
+from itertools import accumulate
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import BufferingHandler
+from pathlib import Path
+import json
+import logging
+import os
 import re
+import sys
 
 from .common import TcTool
 from .format_rules import (
@@ -21,67 +30,56 @@ Segment = Tuple[Kind, List[str], str]
 
 
 class XmlMachine:
-    """Helper class to identify code bits inside an XML path."""
+    """Helper class to identify code bits inside an XML path.
 
-    _re_name = re.compile(r'Name="(\w+)"')
+    All keys that open or close a code block (and the names of the objects they belong
+    to) are found in a single regex sweep over the whole content.
+    """
+
+    _re_keys = re.compile(
+        r"(<Declaration><!\[CDATA\[|<ST><!\[CDATA\[|\]\]></Declaration>|\]\]></ST>)"
+        r'|Name="(\w+)"'
+    )
+
+    # Key: (state in which it applies, new state, key is part of new region)
+    _transitions = {
+        "<Declaration><![CDATA[": (Kind.XML, Kind.DECLARATION, False),
+        "<ST><![CDATA[": (Kind.XML, Kind.IMPLEMENTATION, False),
+        "]]></Declaration>": (Kind.DECLARATION, Kind.XML, True),
+        "]]></ST>": (Kind.IMPLEMENTATION, Kind.XML, True),
+    }
 
     def __init__(self):
         self._kind = Kind.XML
         self._name = ""
-        self._row = 0  # Line number inside path
-        self._col = 0  # Position inside line
 
         self.regions: List[Tuple[RowCol, Kind, str]] = []
 
     def parse(self, content: List[str]):
-        """Progress machine line by line."""
+        """Find all regions in the content (a list of lines)."""
         self._kind = Kind.XML
-        self._row = 0
-        self._col = 0
-        self.regions = [((self._row, self._col), Kind.XML, "<unknown>")]
-        for self._row, line in enumerate(content):
-            self._col = 0
+        self.regions = [((0, 0), Kind.XML, "<unknown>")]
 
-            if matches := self._re_name.search(line):
-                self._name = matches.group(1)
+        # Offset of the start of each line, plus the total length:
+        line_starts = [0, *accumulate(len(line) for line in content)]
 
-            while self._col < len(line):
-                self._parse_line(line)
+        for match in self._re_keys.finditer("".join(content)):
+            row = bisect_right(line_starts, match.start()) - 1
+            if match.end() > line_starts[row + 1]:
+                continue  # Match runs over a line without EOL, not a real key
 
-    def _parse_line(self, line: str):
-        """Parse a line, not necessarily starting from the left.
-
-        :param line:
-        """
-        pos_before = self._col
-        if self._kind == Kind.XML:
-            self._find_state_in_line(line, "<Declaration><![CDATA[", Kind.DECLARATION)
-            self._find_state_in_line(line, "<ST><![CDATA[", Kind.IMPLEMENTATION)
-        elif self._kind == Kind.DECLARATION:
-            self._find_state_in_line(line, "]]></Declaration>", Kind.XML, True)
-        elif self._kind == Kind.IMPLEMENTATION:
-            self._find_state_in_line(line, "]]></ST>", Kind.XML, True)
-
-        if self._col == pos_before:
-            self._col = len(line)  # Nothing found, continue to next line
-
-    def _find_state_in_line(
-        self, line, key: str, new_state: Kind, include_key: bool = False
-    ):
-        """Find key elements inside a line to advance the states.
-
-        When ``include_key`` is True, the text of the key is considered part of the new
-        state.
-        """
-        pos = line.find(key, self._col)
-        if pos >= 0:
-            self._kind = new_state
-            self._col = pos + len(key)
+            key, name = match.groups()
+            if name is not None:
+                self._name = name
+                continue
 
-            if not include_key:
-                pos += len(key)
+            old_state, new_state, include_key = self._transitions[key]
+            if self._kind != old_state:
+                continue
 
-            self.regions.append(((self._row, pos), self._kind, self._name))
+            self._kind = new_state
+            pos = match.start() if include_key else match.end()
+            self.regions.append(((row, pos - line_starts[row]), self._kind, self._name))
             # First character of the new region
 
 
@@ -95,17 +93,30 @@ class Formatter(TcTool):
 
     _RULE_CLASSES: List[Type[FormattingRule]] = []
 
+    _re_lines = re.compile(r"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+$")  # Lines incl. EOL
+
+    # Last part of an `.editorconfig` section that can only depend on the extension of a
+    # file, like `*`, `*.TcPOU` or `**.{TcPOU,TcDUT}`:
+    _re_section_by_extension = re.compile(r"\*{1,2}(\.\w+|\.\{[\w,]+\})?")
+
     def __init__(self, *args):
         super().__init__(*args)
 
+        self._argv = args  # Kept to create copies in worker processes
+
         # Keep some dynamic properties around just so we don't have to constantly pass
         # them between methods
         self._file = ""
-        self._properties = OrderedDict()
+        self._properties: Dict[str, str] = {}
         self._rules: List[FormattingRule] = []
+        self._rules_cache: Dict[str, List[FormattingRule]] = {}  # Keyed by properties
 
         self._number_corrections = 0  # Track number of changes for the current file
 
+        # Editorconfig results, keyed by folder and file extension:
+        self._properties_cache: Dict[Tuple[str, str], Dict[str, str]] = {}
+        self._folder_cacheable: Dict[str, bool] = {}  # See `_is_folder_cacheable()`
+
     @classmethod
     def set_arguments(cls, parser):
         super().set_arguments(parser)
@@ -118,13 +129,26 @@ class Formatter(TcTool):
     def register_rule(cls, new_rule: Type[FormattingRule]):
         """Incorporate a new formatting rule (accounting for its priority)."""
         cls._RULE_CLASSES.append(new_rule)
-        sorted(cls._RULE_CLASSES, key=lambda item: item.PRIORITY)
+        cls._RULE_CLASSES.sort(key=lambda item: item.PRIORITY)
+
+    @classmethod
+    def _get_rules_key(cls) -> str:
+        """Get a string that identifies the registered rules, see ``--cache``."""
+        return ",".join(
+            f"{rule.__module__}.{rule.__qualname__}" for rule in cls._RULE_CLASSES
+        )
 
     def run(self) -> int:
         files = self.find_files()
 
-        for file in files:
-            self.format_file(str(file))
+        jobs = self.args.jobs or 1  # Processes only when asked for, they are costly
+        if jobs > 1 and len(files) > 1:
+            self.format_files_parallel(files, jobs)
+        else:
+            for file in files:
+                self.format_file(str(file))
+
+        self.save_cache()
 
         self.logger.info(f"Checked {self.files_checked} path(s)")
 
@@ -139,34 +163,77 @@ class Formatter(TcTool):
         self.logger.info(f"Re-saved {self.files_resaved} path(s)")
         return 0
 
+    def format_files_parallel(self, files: List[Path], jobs: int):
+        """Format files spread over a pool of processes.
+
+        The rules are pure Python, so threads would not help. Workers send back their
+        counters and log records, which are handled here in the original file order.
+        """
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(files)),
+            initializer=_init_worker,
+            initargs=(self._argv,),
+        ) as executor:
+            results = executor.map(_format_file_in_worker, map(str, files), chunksize=8)
+            for path, counters, records, cache_entry in results:
+                self.files_checked += counters[0]
+                self.files_to_alter += counters[1]
+                self.files_resaved += counters[2]
+
+                for record in records:
+                    self.logger.handle(record)
+
+                if cache_entry is not None:
+                    self._load_cache()[path] = cache_entry
+                    self._cache_changed = True
+
     def format_file(self, path: str):
         """Format (or check) a specific path.
 
         The path is read as text and code inside XML tags is detected manually. Other
         lines of XML remain untouched.
         """
-        with open(path, "r", encoding="utf-8", errors="ignore", newline="") as fh:
-            content = fh.readlines()
-
         self._file = path
 
-        self._properties = get_properties(path)
+        self._properties = self.get_properties(path)
         if not self._properties:
             self.logger.warning(f"Editorconfig properties is empty for file `{path}`")
 
         self.files_checked += 1
         self._number_corrections = 0
 
-        self.logger.debug(f"Processing path `{path}`...")
+        properties_str = json.dumps(self._properties)  # Result depends on these too
+        # Before reading the file, and the (registered) rules matter as well:
+        cache_entry = self.get_cache_entry(path, properties_str + self._get_rules_key())
+        if self.is_file_cached(path, cache_entry):
+            self.dlog("Skipping unchanged path `%s`", path)
+            return
+
+        with open(path, "rb") as fh:
+            text = fh.read().decode("utf-8", errors="ignore")
+
+        # Like `readlines()` with `newline=""`, unlike `str.splitlines()` that also
+        # splits on e.g. form-feeds:
+        content = self._re_lines.findall(text)
+
+        self.dlog("Processing path `%s`...", path)
 
-        self._rules = [rule(self._properties) for rule in self._RULE_CLASSES]
+        self._rules = self._rules_cache.get(properties_str, None)
+        if self._rules is None:
+            # Rules only depend on the properties, re-use them for similar files
+            rules = (rule(self._properties) for rule in self._RULE_CLASSES)
+            self._rules = [rule for rule in rules if rule.is_enabled()]
+            self._rules_cache[properties_str] = self._rules
 
         # Do whole-file rules first:
         for rule in self._rules:
             if rule.WHOLE_FILE:
                 self.apply_rule(rule, content)
 
-        segments: List[Segment] = list(self.split_code_segments(content))
+        if "<![CDATA[" in text:
+            segments: List[Segment] = list(self.split_code_segments(content))
+        else:
+            segments = [(Kind.XML, content, "")]  # No code in here, skip the parsing
 
         for kind, segment, _ in segments:
             # Changes are done in-place
@@ -174,15 +241,90 @@ class Formatter(TcTool):
 
         if self._number_corrections > 0:
             self.files_to_alter += 1
+        else:
+            self.cache_file(path, cache_entry)
 
         if not self.args.dry and not self.args.check and self._number_corrections > 0:
-            with open(path, "w", newline="", encoding="utf-8") as fh:
-                # Keep newline symbols inside strings
-                for _, segment, _ in segments:
-                    fh.write("".join(segment))
+            new_text = "".join(line for _, segment, _ in segments for line in segment)
+            with open(path, "wb") as fh:
+                fh.write(new_text.encode("utf-8"))  # Newline symbols are kept as-is
 
             self.files_resaved += 1
 
+    def get_properties(self, path: str) -> Dict[str, str]:
+        """Get editorconfig properties for a file.
+
+        Files in one folder typically share their config, so results are cached per
+        folder and file extension, as long as the config sections don't look at more
+        of the file name than the extension.
+        """
+        folder, name = os.path.split(path)
+        key = (folder, os.path.splitext(name)[1])
+        properties = self._properties_cache.get(key, None)
+        if properties is None:
+            properties = get_properties(path)
+            if self._is_folder_cacheable(folder):
+                self._properties_cache[key] = properties
+
+        return properties
+
+    def _is_folder_cacheable(self, folder: str) -> bool:
+        """True if all editorconfig sections for a folder only look at extensions."""
+        cacheable = self._folder_cacheable.get(folder, None)
+        if cacheable is not None:
+            return cacheable
+
+        cacheable = True
+        directory = folder
+        while True:
+            config = os.path.join(directory, ".editorconfig")
+            if os.path.isfile(config):
+                sections, is_root = self._read_config_sections(config)
+                if sections is None or not all(
+                    self._re_section_by_extension.fullmatch(section.rpartition("/")[2])
+                    for section in sections
+                ):
+                    cacheable = False
+                    break
+                if is_root:
+                    break
+
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break  # Reached the top
+            directory = parent
+
+        self._folder_cacheable[folder] = cacheable
+        return cacheable
+
+    @staticmethod
+    def _read_config_sections(config: str) -> Tuple[Optional[List[str]], bool]:
+        """Get section names of an ``.editorconfig`` and whether it is a root file.
+
+        The regexes of the ``editorconfig`` parser itself are used, so both agree on
+        what a section is. Sections are ``None`` if a header could not be parsed.
+        """
+        sections = []
+        is_root = False
+        with open(config, "r", encoding="utf-8", errors="ignore") as fh:
+            for line in fh:
+                line = line.lstrip("\ufeff")  # Strip BOM
+                if line.strip() == "" or line[0] in "#;":
+                    continue  # Empty or comment
+
+                if match := EditorConfigParser.SECTCRE.match(line):
+                    sections.append(match.group("header"))
+                elif line.lstrip().startswith("["):
+                    return None, False  # Unclear, rather not cache anything
+                elif not sections and (match := EditorConfigParser.OPTCRE.match(line)):
+                    option, value = match.group("option", "value")
+                    if option.rstrip().lower() == "root":
+                        if comment := re.search("(.*?) [;#]", value):
+                            value = comment.group(1)  # Same as `editorconfig`
+                        is_root = value.strip().lower() == "true"
+
+        return sections, is_root
+
     @staticmethod
     def split_code_segments(content: List[str]):
         """Copy content, split into XML and code sections.
@@ -245,11 +387,64 @@ class Formatter(TcTool):
         corrections = rule.consume_corrections()
         self._number_corrections += len(corrections)
 
+        if not corrections or not self.logger.isEnabledFor(logging.DEBUG):
+            return  # Skip building the messages
+
         tag = f"[{kind.name.lower()}]" if kind else "[file]"
 
         for line_nr, message in corrections:
             # `line_r` is zero-indexed
-            self.logger.debug(f"{self._file}{tag}:{line_nr + 1}\t{message}")
+            self.logger.debug("%s%s:%d\t%s", self._file, tag, line_nr + 1, message)
+
+
+# Formatter instance inside a worker process, see `Formatter.format_files_parallel()`:
+_worker_formatter: Optional[Formatter] = None
+
+
+def _init_worker(argv: Tuple[str, ...]):
+    """Create the formatter of a worker process, collecting its log records."""
+    global _worker_formatter
+    _worker_formatter = Formatter(*argv)
+
+    handler = BufferingHandler(capacity=sys.maxsize)  # Never flushes by itself
+    _worker_formatter.logger.handlers = [handler]
+    _worker_formatter.logger.propagate = False  # Records are passed to the main process
+
+
+def _format_file_in_worker(path: str):
+    """Format a single file inside a worker process."""
+    formatter = _worker_formatter
+    counters_before = (
+        formatter.files_checked,
+        formatter.files_to_alter,
+        formatter.files_resaved,
+    )
+
+    cache = formatter._load_cache() if formatter.args.cache else {}
+    cache_entry_before = cache.get(path, None)
+
+    formatter.format_file(path)
+
+    counters = (
+        formatter.files_checked - counters_before[0],
+        formatter.files_to_alter - counters_before[1],
+        formatter.files_resaved - counters_before[2],
+    )
+
+    handler: BufferingHandler = formatter.logger.handlers[0]
+    records = handler.buffer
+    handler.buffer = []
+    for record in records:
+        record.msg = record.getMessage()  # Make sure the record can be pickled
+        record.args = None
+        record.exc_info = None
+
+    # Only pass on entries written just now, not the ones loaded from disk:
+    cache_entry = cache.get(path, None)
+    if cache_entry is cache_entry_before:
+        cache_entry = None
+
+    return path, counters, records, cache_entry
 
 
 Formatter.register_rule(FormatTabs)
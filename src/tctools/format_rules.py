@@ -1,4 +1,4 @@
-from typing import List, Dict, OrderedDict, Tuple, Optional, Type, Any
+from typing import List, Dict, Tuple, Optional, Type, Any
 from abc import ABC, abstractmethod
 import re
 import math
@@ -22,7 +22,9 @@ class FormattingRule(ABC):
     PRIORITY = 100
     WHOLE_FILE = False
 
-    def __init__(self, properties: OrderedDict):
+    _re_any_line_ending = re.compile(r"(\r\n|\n|\r)")  # Find any full EOL
+
+    def __init__(self, properties: Dict[str, str]):
         self._properties = properties
         self._corrections: List[Correction] = []
 
@@ -45,8 +47,6 @@ class FormattingRule(ABC):
         options = {"lf": "\n", "cr": "\r", "crlf": "\r\n"}
         self._line_ending: str = options.get(self._end_of_line, "\n")
 
-        self._re_any_line_ending = re.compile(r"(\r\n|\n|\r)")  # Find any full EOL
-
     @property
     def actual_indent_size(self) -> int:
         """Tab width for style=tabs or indent size for style=spaces."""
@@ -81,6 +81,13 @@ class FormattingRule(ABC):
 
         return value_type(value)
 
+    def is_enabled(self) -> bool:
+        """Return False if the rule would never change anything with its properties.
+
+        Disabled rules are skipped entirely by the formatter.
+        """
+        return True
+
     @abstractmethod
     def format(self, content: List[str], kind: Optional[Kind] = None):
         """Fun rule to format text.
@@ -107,47 +114,44 @@ class FormattingRule(ABC):
 class FormatTabs(FormattingRule):
     """Check usage of tab character."""
 
-    _re_tab = re.compile(r"\t")
     _re_spaces = re.compile(r"  +")  # Match two spaces or more
 
     def __init__(self, *args):
         super().__init__(*args)
 
+    def is_enabled(self) -> bool:
+        return self._indent_style in ("tab", "space")
+
     def format(self, content: List[str], kind: Optional[Kind] = None):
         if self._indent_style == "tab":
-            re_search = self._re_spaces
+            candidate = "  "
+            message = "Line contains an indent that should be a tab"
         elif self._indent_style == "space":
-            re_search = self._re_tab
+            candidate = "\t"
+            message = "Line contains a tab that should be spaces"
         else:
             return
 
+        is_tab = self._indent_str == "\t"
+        tab_width = self._tab_width
+        indent_size = self._indent_size
+        subn = self._re_spaces.subn
+
+        def replace(match: re.Match) -> str:
+            return "\t" * math.ceil((match.end() - match.start()) / tab_width)
+
         for i, line in enumerate(content):
-            pos = 0
-            count = 0
-            while (matches := re_search.search(line, pos)) is not None:
-                pos = matches.end()
-                num_chars = (
-                    int(math.ceil((matches.end() - matches.start()) / self._tab_width))
-                    if self._indent_str == "\t"
-                    else self._indent_size - (matches.start() % self._indent_size)
-                )
+            if candidate not in line:
+                continue  # Much cheaper than running the regex
 
-                line = (
-                    line[: matches.start()]
-                    + self._indent_str[0] * num_chars
-                    + line[matches.end() :]
-                )
-                count += 1
+            if is_tab:
+                line, count = subn(replace, line)  # One pass over the line
+            else:
+                # Pads each tab to the next tab stop, like the regex used to:
+                line, count = line.expandtabs(indent_size), 1
 
             if count > 0:
-                self.add_correction(
-                    (
-                        "Line contains an indent that should be a tab"
-                        if self._indent_str == "\t"
-                        else "Line contains a tab that should be spaces"
-                    ),
-                    i,
-                )
+                self.add_correction(message, i)
                 content[i] = line
 
 
@@ -156,9 +160,6 @@ class FormatTrailingWhitespace(FormattingRule):
 
     PRIORITY = 90  # Precede `FinalNewline`
 
-    _re_trailing_ws = re.compile(r"([^\S\r\n]+)([\r\n])*$")
-    # Match whitespace (but not newlines) before (any) newline at the end of the line
-
     def __init__(self, *args):
         super().__init__(*args)
 
@@ -166,13 +167,17 @@ class FormatTrailingWhitespace(FormattingRule):
             "trim_trailing_whitespace", False, value_type=bool
         )
 
+    def is_enabled(self) -> bool:
+        return bool(self._remove_tr_ws)
+
     def format(self, content: List[str], kind: Optional[Kind] = None):
         if not self._remove_tr_ws:
             return  # Nothing to do
         for i, line in enumerate(content):
-            line, count = re.subn(self._re_trailing_ws, r"\2", line)  # Keep group #2
-            if count:
-                content[i] = line
+            body = line.rstrip("\r\n")
+            new_body = body.rstrip()  # Whitespace other than the EOL
+            if len(new_body) != len(body):
+                content[i] = new_body + line[len(body) :]  # Keep the EOL as-is
                 self.add_correction("Line contains trailing whitespace", i)
 
 
@@ -186,6 +191,9 @@ class FormatInsertFinalNewline(FormattingRule):
             "insert_final_newline", False, value_type=bool
         )
 
+    def is_enabled(self) -> bool:
+        return bool(self._insert_final_newline)
+
     def format(self, content: List[str], kind: Optional[Kind] = None):
         if not self._insert_final_newline:
             return
@@ -194,13 +202,11 @@ class FormatInsertFinalNewline(FormattingRule):
             return
 
         idx = len(content) - 1
-        while idx >= 0:
-            if content[idx].endswith("\n") or content[idx].endswith("\r"):
-                return  # Newline found
-            if content[idx] == "":
-                idx -= 1  # Empty line, try the one before
-            else:
-                break  # Last content should be a newline, stay in function
+        while idx > 0 and content[idx] == "":
+            idx -= 1  # Empty line, try the one before
+
+        if content[idx].endswith(("\n", "\r")):
+            return  # Newline found
 
         match = self._re_any_line_ending.search(content[0])
         # Get present EOL from first line
@@ -216,39 +222,56 @@ class FormatEndOfLine(FormattingRule):
     WHOLE_FILE = True
     PRIORITY = 50  # Better do it a bit early
 
+    # Pattern of wrong line endings, for each setting:
+    _re_wrong_line_ends = {
+        "lf": re.compile(r"\r\n|\r"),  # Works because Windows is first in the list
+        "cr": re.compile(r"\r\n|\n"),
+        "crlf": re.compile(r"\r(?!\n)|(?<!\r)\n"),
+        # Match "\r" NOT followed by "\n" and match "\n" NOT preceded by "\r"
+    }
+
     def __init__(self, *args):
         super().__init__(*args)
 
         self._re_line_end = None
 
         if self._end_of_line is not None:
-            if self._end_of_line == "lf":
-                self._re_line_end = re.compile(r"\r\n|\r")
-                # Works because Windows is first in the list
-            elif self._end_of_line == "cr":
-                self._re_line_end = re.compile(r"\r\n|\n")
-            elif self._end_of_line == "crlf":
-                self._re_line_end = re.compile(r"\r(?!\n)|(?<!\r)\n")
-                # Match "\r" NOT followed by "\n" and match "\n" NOT preceded by "\r"
-            else:
+            self._re_line_end = self._re_wrong_line_ends.get(self._end_of_line, None)
+            if self._re_line_end is None:
                 raise ValueError(f"Unrecognized file ending `{self._line_ending}`")
 
+        self._eol_display = self._line_ending.encode("unicode_escape")
+
+    def is_enabled(self) -> bool:
+        return self._end_of_line is not None
+
     def format(self, content: List[str], kind: Optional[Kind] = None):
         if self._end_of_line is None:
             return  # Nothing specified
 
+        # Most files are fine already, check those in a single pass:
+        text = "".join(content)
+        if self._end_of_line == "lf":
+            if "\r" not in text:
+                return  # Plain substring search, no need for the regex
+        elif self._end_of_line == "cr":
+            if "\n" not in text:
+                return
+        elif self._re_line_end.search(text) is None:
+            return
+
         count = 0
+        subn = self._re_line_end.subn
         for i, line in enumerate(content):
-            line, new = re.subn(self._re_line_end, self._line_ending, line)
+            line, new = subn(self._line_ending, line)
             if new > 0:
                 content[i] = line
                 count += new
 
-        eol = self._line_ending.encode("unicode_escape")
-
         if count > 0:
             self.add_correction(
-                f"{count} line endings need to be corrected to {eol}`", 0
+                f"{count} line endings need to be corrected to {self._eol_display}`",
+                0,
             )
 
 
@@ -260,6 +283,19 @@ class FormatVariablesAlign(FormattingRule):
 
     PRIORITY = 110  # Go after FormatTabs
 
+    _re_variable = re.compile(
+        r"""
+            ^\s*                # Start of string + any ws
+            (\S+)               # Sequence of non-ws
+            \s*:                # Any ws + literal ":"
+            \s*(.+?);           # Any ws + any sequence + literal ";"
+            \s*([^\r\n]+)?      # Any ws + (Optional) any sequence
+    """,
+        re.VERBOSE,
+    )
+
+    _re_newlines = re.compile(r"[\r\n]+$")
+
     def __init__(self, *args):
         super().__init__(*args)
 
@@ -267,18 +303,8 @@ class FormatVariablesAlign(FormattingRule):
             "twincat_align_variables", False, value_type=bool
         )
 
-        self._re_variable = re.compile(
-            r"""
-                ^\s*                # Start of string + any ws
-                (\S+)               # Sequence of non-ws
-                \s*:                # Any ws + literal ":"
-                \s*(.+?);           # Any ws + any sequence + literal ";"
-                \s*([^\r\n]+)?      # Any ws + (Optional) any sequence
-        """,
-            re.VERBOSE,
-        )
-
-        self._re_newlines = re.compile(r"[\r\n]+$")
+    def is_enabled(self) -> bool:
+        return bool(self._align)
 
     def format(self, content: List[str], kind: Optional[Kind] = None):
         if not self._align:
@@ -299,6 +325,9 @@ class FormatVariablesAlign(FormattingRule):
         max_chunk_sizes: List[Optional[int]] = [None] * 3
 
         for i, line in enumerate(content):
+            if ":" not in line or ";" not in line:
+                continue  # E.g. `VAR` or an empty line, skip the regex
+
             match = self._re_variable.match(line)
             if not match:
                 continue
@@ -356,21 +385,50 @@ class FormatVariablesAlign(FormattingRule):
 
         ``end_level = 1`` would pad until ``line`` is e.g. 4 characters.
         """
-        index = math.floor(len(line) / self.actual_indent_size)
-
-        padding_str = ""
-        for i in range(tab_index - index):
-            new_indent = (
-                self._get_indent_string(col=len(line)) if i == 0 else self._indent_str
-            )
-            padding_str += new_indent
+        num_indents = tab_index - len(line) // self.actual_indent_size
+        if num_indents <= 0:
+            return ""
 
-        return padding_str
+        # First indent only pads up to the next tab stop:
+        return self._get_indent_string(col=len(line)) + self._indent_str * (
+            num_indents - 1
+        )
 
 
 class FormatConditionalParentheses(FormattingRule):
     """Formatter to make uses of parentheses inside IF, CASE and WHILE consistent."""
 
+    # Regex to find conditional inside single lines:
+    _re_needs_parentheses = re.compile(
+        r"""
+            # Look for start of string or new line:
+            ^
+            # Match keyword with surrounding ws:
+            \s*(?:IF|WHILE|CASE)\s+
+            # Match any characters NOT starting with "("
+            # We cannot match the closing bracket, as this could be from a
+            # function call
+            ([^(\r\n].+?)
+            # Match keyword with preceding ws:
+            \s+(?:THEN|DO|OF)
+        """,
+        re.VERBOSE | re.MULTILINE,
+    )
+
+    _re_removes_parentheses = re.compile(
+        r"""
+            # Look for start of string or new line:
+            ^
+            # Match IF with surrounding ws:
+            \s*(?:IF|WHILE|CASE)\s*
+            # Match any characters within ():
+            \((.+)\)
+            # Match THEN with preceding ws:
+            \s*(?:THEN|DO|OF)
+        """,
+        re.VERBOSE | re.MULTILINE,
+    )
+
     def __init__(self, *args):
         super().__init__(*args)
 
@@ -378,37 +436,8 @@ class FormatConditionalParentheses(FormattingRule):
             "twincat_parentheses_conditionals", value_type=bool
         )
 
-        # Regex to find conditional inside single lines:
-
-        self._re_needs_parentheses = re.compile(
-            r"""
-                # Look for start of string or new line:
-                ^
-                # Match keyword with surrounding ws:
-                \s*(?:IF|WHILE|CASE)\s+
-                # Match any characters NOT starting with "("
-                # We cannot match the closing bracket, as this could be from a
-                # function call
-                ([^(\r\n].+?)
-                # Match keyword with preceding ws:
-                \s+(?:THEN|DO|OF)
-            """,
-            re.VERBOSE | re.MULTILINE,
-        )
-
-        self._re_removes_parentheses = re.compile(
-            r"""
-                # Look for start of string or new line:
-                ^
-                # Match IF with surrounding ws:
-                \s*(?:IF|WHILE|CASE)\s*
-                # Match any characters within ():
-                \((.+)\)
-                # Match THEN with preceding ws:
-                \s*(?:THEN|DO|OF)
-            """,
-            re.VERBOSE | re.MULTILINE,
-        )
+    def is_enabled(self) -> bool:
+        return self._parentheses is not None
 
     def format(self, content: List[str], kind: Optional[Kind] = None):
         if self._parentheses is None:
@@ -419,7 +448,11 @@ class FormatConditionalParentheses(FormattingRule):
         else:
             pattern = self._re_removes_parentheses
 
+        keywords = ("IF", "WHILE", "CASE")
         for i, line in enumerate(content):
+            if not line.lstrip().startswith(keywords):
+                continue  # Cannot match, skip the regex
+
             # Do a manual match + replace, instead of e.g. subn(), because we might
             # need to add extra spaces after removing parentheses
             if match := pattern.search(line):
@@ -430,6 +463,9 @@ class FormatConditionalParentheses(FormattingRule):
                 if self._parentheses:
                     condition = "(" + condition + ")"
                 else:
+                    if self._has_negative_level(condition):
+                        continue  # Outer parentheses do not belong together
+
                     prefix = prefix[:-1]  # Remove parentheses
                     suffix = suffix[1:]
 
@@ -449,3 +485,20 @@ class FormatConditionalParentheses(FormattingRule):
                 )
 
                 content[i] = prefix + condition + suffix
+
+    @staticmethod
+    def _has_negative_level(text: str) -> bool:
+        """Return True if a closing parenthesis appears before its opening one.
+
+        E.g. for ``1+1)*(2`` the found outer parentheses were not a pair.
+        """
+        level = 0
+        for char in text:
+            if char == "(":
+                level += 1
+            elif char == ")":
+                level -= 1
+                if level < 0:
+                    return True
+
+        return False
@@ -1,6 +1,7 @@
-from typing import Dict
+from typing import Dict, Iterable
 from git import Repo
 from pathlib import Path
+import re
 
 from .common import Tool
 
@@ -13,6 +14,19 @@ class GitInfo(Tool):
     collide with XML brackets in ``$key`` the dollar sign is a key for string constants.
     """
 
+    # All keys that can be used in templates, like ``{{GIT_HASH}}``:
+    KEYWORDS = (
+        "HASH",
+        "HASH_SHORT",
+        "DATE",
+        "TAG",
+        "BRANCH",
+        "DESCRIPTION",
+        "DESCRIPTION_DIRTY",
+    )
+
+    _re_keyword = re.compile(r"{{GIT_(\w+)}}")
+
     def __init__(self, *args):
         super().__init__(*args)
 
@@ -56,15 +70,14 @@ class GitInfo(Tool):
 
         repo = Repo(repo_path, search_parent_directories=True)
 
-        keywords_used = 0
+        # Only get the info that the template actually uses:
+        keywords = set(self._re_keyword.findall(content)).intersection(self.KEYWORDS)
+        info = self._get_info(repo, keywords)
 
-        info = self._get_info(repo)
-        for keyword, value in info.items():
-            new_content = content.replace(f"{{{{GIT_{keyword}}}}}", value)
-            if new_content != content:
-                keywords_used += 1
-
-            content = new_content
+        content = self._re_keyword.sub(
+            lambda match: info.get(match.group(1), match.group()), content
+        )  # Unknown keys are left in place
+        keywords_used = len(info)
 
         self.logger.info(f"Applied {keywords_used} keyword(s) to template")
 
@@ -90,34 +103,48 @@ class GitInfo(Tool):
         self.logger.debug(f"Wrote to file `{output_path.absolute()}`")
         return 0
 
-    def _get_info(self, repo: Repo) -> Dict[str, str]:
+    def _get_info(self, repo: Repo, keywords: Iterable[str]) -> Dict[str, str]:
+        """Get the values of the given keywords.
+
+        Only the requested values are computed, as each ``git`` call is a new process.
+        """
         try:
-            git_hash = (repo.head.object.hexsha,)
+            commit = repo.head.object
         except ValueError as err:
             self.logger.warning("Repository is probably empty: " + str(err))
-            git_hash = None
-
-        if isinstance(git_hash, tuple):
-            git_hash = git_hash[0]
+            commit = None
 
         empty = "[empty]"
 
-        return {
-            "HASH": git_hash or empty,
-            "HASH_SHORT": git_hash[:8] if git_hash else empty,
-            "DATE": (
-                repo.head.object.committed_datetime.strftime("%d-%m-%Y %H:%M:%S")
-                if git_hash
-                else empty
-            ),
-            "TAG": repo.git.tag() if git_hash else empty,
-            "BRANCH": repo.active_branch.name if git_hash else empty,
-            "DESCRIPTION": (
-                repo.git.describe("--tags", "--always") if git_hash else empty
-            ),
-            "DESCRIPTION_DIRTY": (
-                repo.git.describe("--tags", "--dirty", "--always")
-                if git_hash
-                else empty
-            ),
+        if commit is None:
+            return dict.fromkeys(keywords, empty)
+
+        git_hash = commit.hexsha
+
+        def get_description_dirty() -> str:
+            return repo.git.describe("--tags", "--dirty", "--always")
+
+        def get_description() -> str:
+            # Describe only once if both are used, the dirty marker is the only
+            # difference:
+            description = info.get("DESCRIPTION_DIRTY") or get_description_dirty()
+            if description.endswith("-dirty"):
+                description = description[: -len("-dirty")]
+            return description
+
+        getters = {
+            "HASH": lambda: git_hash,
+            "HASH_SHORT": lambda: git_hash[:8],
+            "DATE": lambda: commit.committed_datetime.strftime("%d-%m-%Y %H:%M:%S"),
+            "TAG": lambda: repo.git.tag(),
+            "BRANCH": lambda: repo.active_branch.name,
+            "DESCRIPTION_DIRTY": get_description_dirty,
+            "DESCRIPTION": get_description,
         }
+
+        info: Dict[str, str] = {}
+        for key, getter in getters.items():  # In order, so the description is re-used
+            if key in keywords:
+                info[key] = getter()
+
+        return info
@@ -1,8 +1,12 @@
 from typing import Dict
 from lxml import etree
+import logging
 import re
 
-from .common import TcTool, Element
+from .common import TcTool
+
+
+Element = etree._Element  # noqa
 
 
 class XmlSorter(TcTool):
@@ -22,6 +26,15 @@ class XmlSorter(TcTool):
         self._file_changed = False  # True if any change is made in the current path
         # This is a property to avoid passing around booleans between recursive calls
 
+    @property
+    def _file_changed(self) -> bool:
+        # Kept per thread, since files are sorted in parallel
+        return getattr(self._local, "file_changed", False)
+
+    @_file_changed.setter
+    def _file_changed(self, value: bool):
+        self._local.file_changed = value
+
     @classmethod
     def set_arguments(cls, parser):
         super().set_arguments(parser)
@@ -39,8 +52,8 @@ class XmlSorter(TcTool):
         return parser
 
     def run(self) -> int:
-        for file in self.find_files():
-            self.sort_file(str(file))
+        self.process_files(self.find_files(), self.sort_file, self.args.jobs)
+        self.save_cache()
 
         self.logger.info(f"Checked {self.files_checked} path(s)")
 
@@ -56,9 +69,15 @@ class XmlSorter(TcTool):
 
     def sort_file(self, path: str):
         """Sort a single path."""
-        tree = self.get_xml_tree(path)
+        with self._lock:
+            self.files_checked += 1
 
-        self.files_checked += 1
+        cache_entry = self.get_cache_entry(path)  # Before reading the file
+        if self.is_file_cached(path, cache_entry):
+            self.dlog("Skipping unchanged path `%s`", path)
+            return
+
+        tree = self.get_xml_tree(path)
         self._file_changed = False  # Reset
 
         root = tree.getroot()
@@ -67,20 +86,19 @@ class XmlSorter(TcTool):
         # Re-indent by a double space
         etree.indent(tree, space="  ", level=0)
 
-        self.logger.debug(f"Processing path `{path}`...")
+        self.dlog("Processing path `%s`...", path)
 
         tree_bytes = etree.tostring(root, doctype=self.header_before)
 
-        with open(path, "rb") as fh:
-            current_contents = fh.readlines()
-
-        current_bytes = b"".join(current_contents)
+        current_bytes = self.content_before  # Don't read the file again
 
         if self._file_changed:
-            self.files_to_alter += 1
+            with self._lock:
+                self.files_to_alter += 1
 
         if current_bytes != tree_bytes:
-            if self.args.dry:
+            if self.args.dry and self.logger.isEnabledFor(logging.DEBUG):
+                # Guard the block as a whole, decoding the content is expensive
                 self.logger.debug(f"Old path contents of `{path}`:")
                 self.logger.debug("-" * 50)
                 self.logger.debug(current_bytes.decode("utf-8"))
@@ -90,16 +108,18 @@ class XmlSorter(TcTool):
                 self.logger.debug(tree_bytes.decode("utf-8"))
                 self.logger.debug("-" * 50)
 
-            self.logger.debug(f"File can be re-sorted: `{path}`")
+            self.dlog("File can be re-sorted: `%s`", path)
 
             if not self.args.check and not self.args.dry:
                 with open(path, "wb") as fh:
                     fh.write(tree_bytes)
                     # Write by hand (instead of `tree.write()` so we control the header
+                with self._lock:
                     self.files_resaved += 1
         else:
             if self.args.dry:
-                self.logger.debug("Content identical for `{path}`")
+                self.dlog("Content identical for `%s`", path)
+            self.cache_file(path, cache_entry)
 
     def sort_node_recursively(self, node: Element):
         """Sort a node and any sub-nodes, and their sub-nodes.
@@ -3,7 +3,9 @@ import subprocess
 import sys
 
 import tctools.format
-from tctools.format_class import Formatter
+from tctools.format_class import Formatter, XmlMachine
+from tctools.format_extras import Kind
+from tctools.format_rules import FormattingRule
 
 from .conftest import assert_strings_have_substrings
 
@@ -269,3 +271,207 @@ def test_reformat_eol(plc_code, eol):
 
     content_after = file.read_bytes()
     assert content_after == expected_eol.join(content_list).encode()
+
+
+def test_cache(plc_code, caplog, monkeypatch, tmp_path):
+    """Test formatted files are skipped in the next run, until the config changes."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = plc_code / "TwinCAT Project1" / ".editorconfig"
+    config.write_text(
+        """root = true
+[*.TcPOU]
+indent_style = space
+indent_size = 4
+"""
+    )
+    file = plc_code / "TwinCAT Project1" / "MyPlc" / "POUs" / "FB_Example.TcPOU"
+
+    tctools.format.main(str(file), "--cache")  # Re-format
+    tctools.format.main(str(file), "--cache")  # Nothing to change
+    caplog.clear()
+    code = tctools.format.main(str(file), "--check", "--cache", "-l", "DEBUG")
+    assert code == 0
+    assert any("Skipping unchanged" in msg for msg in caplog.messages)
+
+    config.write_text(config.read_text().replace("space", "tab"))
+    caplog.clear()
+    code = tctools.format.main(str(file), "--check", "--cache", "-l", "DEBUG")
+    assert code != 0
+    assert not any("Skipping unchanged" in msg for msg in caplog.messages)
+
+
+def test_cache_registered_rules(plc_code, caplog, monkeypatch, tmp_path):
+    """Test registering another rule invalidates the cache."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    file = plc_code / "TwinCAT Project1" / "MyPlc" / "POUs" / "FB_Example.TcPOU"
+
+    tctools.format.main(str(file), "--cache")
+    tctools.format.main(str(file), "--cache")
+    caplog.clear()
+    tctools.format.main(str(file), "--check", "--cache", "-l", "DEBUG")
+    assert any("Skipping unchanged" in msg for msg in caplog.messages)
+
+    class MyRule(FormattingRule):
+        def format(self, content, kind=None):
+            pass
+
+    monkeypatch.setattr(Formatter, "_RULE_CLASSES", list(Formatter._RULE_CLASSES))
+    Formatter.register_rule(MyRule)
+    caplog.clear()
+    tctools.format.main(str(file), "--check", "--cache", "-l", "DEBUG")
+    assert not any("Skipping unchanged" in msg for msg in caplog.messages)
+
+
+def test_properties_cache(plc_code):
+    """Test editorconfig results are re-used only when sections go by extension."""
+    folder = plc_code / "TwinCAT Project1" / "MyPlc" / "POUs"
+    file1 = str(folder / "FB_Example.TcPOU")
+    file2 = str(folder / "FB_Full.TcPOU")
+
+    config = plc_code / "TwinCAT Project1" / ".editorconfig"
+    config.write_text("root = true\n[*.TcPOU]\nindent_style = space\n")
+
+    formatter = Formatter(file1)
+    properties = formatter.get_properties(file1)
+    assert properties["indent_style"] == "space"
+    assert formatter.get_properties(file2) is properties
+
+    config.write_text(
+        "root = true\n[*.TcPOU]\nindent_style = space\n"
+        "[FB_Full.TcPOU]\nindent_style = tab\n"
+    )
+
+    formatter = Formatter(file1)
+    assert formatter.get_properties(file1)["indent_style"] == "space"
+    assert formatter.get_properties(file2)["indent_style"] == "tab"
+
+    # Sections with a comment are still recognized:
+    config.write_text(
+        "root = true ; comment\n[*.TcPOU]\nindent_style = space\n"
+        "[FB_Full.TcPOU] ; comment\nindent_style = tab\n"
+    )
+
+    formatter = Formatter(file1)
+    assert formatter.get_properties(file1)["indent_style"] == "space"
+    assert formatter.get_properties(file2)["indent_style"] == "tab"
+
+
+def test_rule_priority():
+    """Test registered rules are ordered by priority."""
+    priorities = [rule.PRIORITY for rule in Formatter._RULE_CLASSES]
+    assert priorities == sorted(priorities)
+
+
+def test_parallel_jobs(plc_code, caplog):
+    """Test formatting a folder with worker processes."""
+    config = plc_code / "TwinCAT Project1" / ".editorconfig"
+    config.write_text(
+        """root = true
+[*.TcPOU]
+indent_style = space
+indent_size = 4
+"""
+    )
+    folder = plc_code / "TwinCAT Project1" / "MyPlc"
+    args = (str(folder), "-r", "--filter", "*.TcPOU", "-l", "DEBUG")
+
+    code = tctools.format.main(*args, "--check", "-j", "2")
+    assert code != 0
+    assert "Checked 3 path(s)" in caplog.messages
+    assert any("Line contains a tab" in msg for msg in caplog.messages)
+
+    tctools.format.main(*args, "-j", "2")
+    assert "\t" not in (folder / "POUs" / "FB_Example.TcPOU").read_text()
+
+    code = tctools.format.main(*args, "--check", "-j", "1")
+    assert code == 0
+
+
+def test_parallel_jobs_cache(plc_code, monkeypatch, tmp_path):
+    """Test worker processes do not rewrite a cache that is still up-to-date."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    folder = plc_code / "TwinCAT Project1" / "MyPlc"
+    args = (str(folder), "-r", "--filter", "*.TcPOU", "--cache", "-j", "2")
+
+    tctools.format.main(*args)  # Re-format
+    tctools.format.main(*args)  # Nothing to change, fill cache
+    cache_path = Formatter(*args).get_cache_path()
+    inode = cache_path.stat().st_ino
+
+    code = tctools.format.main(*args, "--check")
+    assert code == 0
+    assert cache_path.stat().st_ino == inode  # File was not replaced
+
+
+def test_split_code_segments():
+    """Test code blocks spread over lines are split from the XML."""
+    content = [
+        '<POU Name="FB_A" Id="1">\n',
+        "<Declaration><![CDATA[VAR\n",
+        "END_VAR\n",
+        "]]></Declaration>\n",
+        "<Implementation><ST><![CDATA[x := 1;\n",
+        "]]></ST></Implementation></POU>\n",
+    ]
+    segments = list(Formatter.split_code_segments(content))
+
+    assert [(kind, name) for kind, _, name in segments] == [
+        (Kind.XML, "<unknown>"),
+        (Kind.DECLARATION, "FB_A"),
+        (Kind.XML, "FB_A"),
+        (Kind.IMPLEMENTATION, "FB_A"),
+        (Kind.XML, "FB_A"),
+    ]
+    assert segments[1][1] == ["VAR\n", "END_VAR\n", ""]
+    assert segments[3][1] == ["x := 1;\n", ""]
+    assert "".join(line for _, lines, _ in segments for line in lines) == "".join(
+        content
+    )
+
+
+def test_split_code_segments_single_line():
+    """Test multiple keys on a single line, each with the name that precedes it."""
+    content = [
+        '<POU Name="FB_A"><Declaration><![CDATA[VAR END_VAR]]></Declaration>'
+        '<Method Name="M_B"><ST><![CDATA[x := 1;]]></ST></Method></POU>\n'
+    ]
+    segments = list(Formatter.split_code_segments(content))
+
+    assert segments == [
+        (Kind.XML, ['<POU Name="FB_A"><Declaration><![CDATA['], "<unknown>"),
+        (Kind.DECLARATION, ["VAR END_VAR"], "FB_A"),
+        (
+            Kind.XML,
+            [']]></Declaration><Method Name="M_B"><ST><![CDATA['],
+            "FB_A",
+        ),
+        (Kind.IMPLEMENTATION, ["x := 1;"], "M_B"),
+        (Kind.XML, ["]]></ST></Method></POU>\n"], "M_B"),
+    ]
+
+
+def test_xml_machine_regions():
+    """Test region starts of the XML scanner, as (row, column)."""
+    content = [
+        "<Declaration><![CDATA[A]]></Declaration> <ST><![CDATA[B\n",
+        "]]></ST>\n",
+    ]
+    machine = XmlMachine()
+    machine.parse(content)
+
+    assert [(rowcol, kind) for rowcol, kind, _ in machine.regions] == [
+        ((0, 0), Kind.XML),
+        ((0, 22), Kind.DECLARATION),
+        ((0, 23), Kind.XML),
+        ((0, 54), Kind.IMPLEMENTATION),
+        ((1, 0), Kind.XML),
+    ]
+
+
+def test_patch_instance(plc_code, mocker):
+    """Test methods of a tool instance can be patched, e.g. to spy on calls."""
+    file = plc_code / "TwinCAT Project1" / "MyPlc" / "POUs" / "FB_Example.TcPOU"
+    formatter = Formatter(str(file), "--check")
+    mocked = mocker.patch.object(formatter, "format_file")
+    formatter.run()
+    mocked.assert_called_once_with(str(file))
@@ -48,6 +48,18 @@ def test_replace_spaces():
     ]
 
 
+def test_replace_spaces_multiple_runs():
+    """Replace every run of spaces on a line, not just the first."""
+    content = ["x    y    z\n", "a  b      c\n"]
+
+    properties = {"indent_style": "tab", "indent_size": 4}
+
+    rule = format_rules.FormatTabs(properties)
+    rule.format(content)
+
+    assert content == ["x\ty\tz\n", "a\tb\t\tc\n"]
+
+
 def test_trailing_ws():
     """Removal of ws."""
     content = [
@@ -76,6 +88,18 @@ def test_trailing_ws():
     ]
 
 
+def test_trailing_ws_crlf():
+    """Removal of ws keeps Windows line endings intact."""
+    content = ["flag1 := FALSE;  \r\n", "flag2 := TRUE;\r\n", "\t\r"]
+
+    properties = {"trim_trailing_whitespace": True}
+
+    rule = format_rules.FormatTrailingWhitespace(properties)
+    rule.format(content)
+
+    assert content == ["flag1 := FALSE;\r\n", "flag2 := TRUE;\r\n", "\r"]
+
+
 content_final_newline = [
     (
         ["flag1 := FALSE;"],
@@ -356,3 +380,29 @@ def test_parentheses_remove_no_ws():
     content = ["IF(inputs.button = 1)THEN"]
     rule.format(content)
     assert content == ["IF inputs.button = 1 THEN"]
+
+
+def test_parentheses_remove_unmatched():
+    rule = format_rules.FormatConditionalParentheses(
+        {"twincat_parentheses_conditionals": False}
+    )
+    content = ["IF (1+1)*2 = 3*(x-1) THEN\n"]
+    rule.format(content)
+    assert content == ["IF (1+1)*2 = 3*(x-1) THEN\n"]
+
+
+def test_rules_disabled():
+    """Without properties, no rule would change anything."""
+    rule_classes = [
+        format_rules.FormatTabs,
+        format_rules.FormatTrailingWhitespace,
+        format_rules.FormatInsertFinalNewline,
+        format_rules.FormatEndOfLine,
+        format_rules.FormatVariablesAlign,
+        format_rules.FormatConditionalParentheses,
+    ]
+    for rule_class in rule_classes:
+        assert not rule_class({}).is_enabled()
+
+    assert format_rules.FormatTabs({"indent_style": "tab"}).is_enabled()
+    assert format_rules.FormatEndOfLine({"end_of_line": "lf"}).is_enabled()
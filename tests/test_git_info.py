@@ -110,3 +110,17 @@ def test_empty_git(plc_code):
     re_tag = re.compile(r"{{\w+}}")
     result = re_tag.search(new_file.read_text())
     assert not result  # Make sure not tags remain
+
+
+def test_unknown_keyword(plc_code):
+    """Test only known keywords get replaced."""
+    file = plc_code / "GitInfo.txt.template"
+    file.write_text("{{GIT_HASH_SHORT}} {{GIT_UNKNOWN}}\n")
+
+    current_dir = Path(__file__).parent  # Repurpose this package repo
+
+    info = GitInfo(str(file), "--repo", str(current_dir))
+    assert info.run() == 0
+
+    content = (file.parent / "GitInfo.txt").read_text()
+    assert re.fullmatch(r"[0-9a-f]{8} {{GIT_UNKNOWN}}\n", content)
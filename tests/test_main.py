@@ -0,0 +1,50 @@
+import pytest
+import subprocess
+import sys
+
+import tctools.__main__
+
+
+@pytest.mark.parametrize("args", [(), ("--help",), ("-h",)])
+def test_help(capsys, args):
+    """Test the help text lists the tools."""
+    assert tctools.__main__.main(*args) == 0
+
+    message = capsys.readouterr().out
+    assert "usage:" in message
+    for tool in tctools.__main__.TOOLS:
+        assert tool in message
+
+
+def test_unknown_tool(capsys):
+    """Test an error is given for an unrecognized tool."""
+    with pytest.raises(SystemExit) as err:
+        tctools.__main__.main("not_a_tool")
+
+    assert err.value.code != 0
+    assert "invalid choice" in capsys.readouterr().err
+
+
+def test_no_heavy_imports():
+    """Test printing help does not load any of the tool dependencies."""
+    code = (
+        "import sys, tctools.__main__ as m; m.main(); "
+        "print('argparse' in sys.modules, 'lxml' in sys.modules)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True)
+
+    assert result.returncode == 0
+    assert result.stdout.decode().split()[-2:] == ["False", "False"]
+
+
+def test_dispatch(plc_code):
+    """Test a tool is run through the dispatcher."""
+    file = plc_code / "books.xml"
+
+    result = subprocess.run(
+        [sys.executable, "-m", "tctools", "xml_sort", str(file), "--check"],
+        capture_output=True,
+    )
+
+    assert result.returncode == 1
+    assert "can be re-sorted" in result.stdout.decode()
@@ -2,6 +2,7 @@ import pytest
 import subprocess
 import sys
 
+import tctools.common
 import tctools.xml_sort
 from tctools.xml_sort_class import XmlSorter
 
@@ -171,7 +172,7 @@ def test_multiple_files(plc_code, caplog):
     file1 = plc_code / "books.xml"
     file2 = plc_code / "plant_catalog.xml"
     tctools.xml_sort.main(str(file1), str(file2), "-l", "DEBUG")
-    result = "\n".join([rec.msg for rec in caplog.records])
+    result = "\n".join([rec.getMessage() for rec in caplog.records])
     assert "books.xml" in result
     assert "plant_catalog.xml" in result
 
@@ -179,7 +180,7 @@ def test_multiple_files(plc_code, caplog):
 def test_folder(plc_code, caplog):
     """Test CLI interface."""
     tctools.xml_sort.main(str(plc_code), "--filter", "*.xml", "-l", "DEBUG")
-    result = "\n".join([rec.msg for rec in caplog.records])
+    result = "\n".join([rec.getMessage() for rec in caplog.records])
     assert "books.xml" in result
     assert "plant_catalog.xml" in result
 
@@ -204,7 +205,7 @@ def test_project(plc_code, caplog):
         "DEBUG",
     )
 
-    result = "\n".join([rec.msg for rec in caplog.records])
+    result = "\n".join([rec.getMessage() for rec in caplog.records])
 
     expected = [
         "TwinCAT Project1.tsproj",
@@ -215,3 +216,135 @@ def test_project(plc_code, caplog):
 
     for exp in expected:
         assert exp in result
+
+
+def test_parser_reused(plc_code):
+    """Test the argument parser is built once and not shared with other tools."""
+    from tctools.common import TcTool
+
+    parser = XmlSorter.get_argument_parser()
+    assert XmlSorter.get_argument_parser() is parser
+    assert TcTool.get_argument_parser() is not parser
+
+    file = str(plc_code / "books.xml")
+    sorter1 = XmlSorter(file, "--check")
+    sorter2 = XmlSorter(file)
+    assert sorter1.args.check and not sorter2.args.check
+
+
+def test_parallel_jobs(plc_code, caplog):
+    """Test sorting multiple files with several threads gives the same result."""
+    code = tctools.xml_sort.main(str(plc_code), "--filter", "*.xml", "--check")
+    assert code != 0
+
+    tctools.xml_sort.main(str(plc_code), "--filter", "*.xml", "-j", "4")
+    assert "Re-saved 4 path(s)" in caplog.messages
+
+    code = tctools.xml_sort.main(
+        str(plc_code), "--filter", "*.xml", "--check", "-j", "1"
+    )
+    assert code == 0
+
+
+def test_cache(plc_code, caplog, monkeypatch, tmp_path):
+    """Test files without changes are skipped in the next run."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    file = plc_code / "books.xml"
+
+    tctools.xml_sort.main(str(file), "--cache", "-l", "DEBUG")  # Changes file
+    tctools.xml_sort.main(str(file), "--cache", "-l", "DEBUG")  # No changes
+    assert not any("Skipping unchanged" in msg for msg in caplog.messages)
+    assert (tmp_path / "cache" / "tctools" / "XmlSorter.json").is_file()
+
+    caplog.clear()
+    code = tctools.xml_sort.main(str(file), "--cache", "--check", "-l", "DEBUG")
+    assert code == 0
+    assert any("Skipping unchanged" in msg for msg in caplog.messages)
+
+    # Different options invalidate the cache:
+    caplog.clear()
+    tctools.xml_sort.main(str(file), "--cache", "-n", "book", "-l", "DEBUG")
+    assert not any("Skipping unchanged" in msg for msg in caplog.messages)
+
+    # Modified files invalidate the cache:
+    file.write_text(file.read_text() + "\n")
+    caplog.clear()
+    tctools.xml_sort.main(str(file), "--cache", "-l", "DEBUG")
+    assert not any("Skipping unchanged" in msg for msg in caplog.messages)
+
+    # A new version of the tools invalidates the cache:
+    tctools.xml_sort.main(str(file), "--cache", "-l", "DEBUG")  # Cache again
+    caplog.clear()
+    tctools.xml_sort.main(str(file), "--cache", "--check", "-l", "DEBUG")
+    assert any("Skipping unchanged" in msg for msg in caplog.messages)
+
+    monkeypatch.setattr(tctools.common, "_get_version", lambda: "99.0.0")
+    caplog.clear()
+    tctools.xml_sort.main(str(file), "--cache", "--check", "-l", "DEBUG")
+    assert not any("Skipping unchanged" in msg for msg in caplog.messages)
+
+
+def test_cache_stale_file(plc_code, monkeypatch, tmp_path):
+    """Test files changed while processing are not cached, deleted ones are pruned."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    file = plc_code / "books.xml"
+    tctools.xml_sort.main(str(file))  # Make sure there is nothing to sort
+
+    sorter = XmlSorter(str(file), "--cache")
+    entry = sorter.get_cache_entry(str(file))
+    file.write_text(file.read_text() + "\n")  # Saved by somebody else meanwhile
+    sorter.cache_file(str(file), entry)
+    assert not sorter.is_file_cached(str(file), sorter.get_cache_entry(str(file)))
+
+    sorter.cache_file(str(file), sorter.get_cache_entry(str(file)))
+    other = plc_code / "other.xml"
+    other.write_text(file.read_text())
+    sorter.cache_file(str(other), sorter.get_cache_entry(str(other)))
+    sorter.save_cache()
+
+    other.unlink()
+    sorter = XmlSorter(str(file), "--cache")
+    assert str(other) in sorter._load_cache()
+    sorter.save_cache()
+
+    sorter = XmlSorter(str(file), "--cache")
+    assert sorter.is_file_cached(str(file), sorter.get_cache_entry(str(file)))
+    assert str(other) not in sorter._load_cache()
+
+
+def test_duplicate_targets(plc_code, caplog):
+    """Test files are processed only once, even when targeted more than once."""
+    file = plc_code / "books.xml"
+    tctools.xml_sort.main(str(plc_code), str(file), "--filter", "*.xml", "books*")
+    assert "Checked 4 path(s)" in caplog.messages
+
+
+def test_filter_with_folder(plc_code):
+    """Test filters with a folder part are relative to the target."""
+    project = plc_code / "TwinCAT Project1"
+    pous = project / "MyPlc" / "POUs"
+    expected = {pous / "FB_Example.TcPOU", pous / "FB_Full.TcPOU", pous / "MAIN.TcPOU"}
+
+    sorter = XmlSorter(str(project / "MyPlc"), "--filter", "POUs/*.TcPOU")
+    assert set(sorter.find_files()) == expected
+
+    sorter = XmlSorter(str(project), "--filter", "POUs/*.TcPOU", "-r")
+    assert set(sorter.find_files()) == expected
+
+    sorter = XmlSorter(str(project), "--filter", "POUs/*.TcPOU")
+    assert sorter.find_files() == []  # Not recursive
+
+
+def test_user_logging_config(plc_code):
+    """Test logging configured by the user after importing is respected."""
+    file = plc_code / "books.xml"
+    code = (
+        "import logging, sys\n"
+        "from tctools.xml_sort_class import XmlSorter\n"
+        "logging.basicConfig(stream=sys.stderr, format='USER %(message)s')\n"
+        f"XmlSorter({str(file)!r}, '--check').run()\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True)
+
+    assert "USER " in result.stderr.decode()
+    assert result.stdout.decode() == ""